@@ -6,15 +6,38 @@ save them to a specified .param file (overwriting previous), and upload the
 changes to a GitHub repository.
 
 Accepts command-line arguments for connection string and output filename.
+For SITL started with sim_vehicle.py, prefer MAVProxy's second UDP output
+(udp:127.0.0.1:14551) over the TCP serial ports (tcp:127.0.0.1:576x);
+telemetry does not need TCP's retransmission and ACK round trips. 14550 is
+left to the ground station, and SITL run without MAVProxy only has the TCP
+ports.
 """
 
 import time
 import os
+import sys
+import errno # To recognise MAVFTP 'file not found' replies
+import hashlib # To compare the new file against the committed blob
+import json # Local caches of per-vehicle and per-remote state
+import struct # To decode the MAVFTP param.pck blob
+import socket # To tune the receive buffer of network links
 import subprocess # To run Git commands
+from concurrent.futures import ThreadPoolExecutor # To overlap git pull with the download
 from datetime import datetime
+from pathlib import PurePath, PurePosixPath # Repo-relative paths as Git expects them
 import argparse # Import the argparse library
+# Use MAVLink 2 framing (must be set before pymavlink is imported)
+os.environ.setdefault('MAVLINK20', '1')
 # Import the mavutil module from Pymavlink
 from pymavlink import mavutil
+try:
+    from pymavlink import mavftp # Bulk parameter download (pymavlink >= 2.4.42)
+except ImportError:
+    mavftp = None
+try:
+    import git # GitPython: one Repo session for pull/add/commit/push
+except ImportError:
+    git = None
 
 # --- Configuration (Constants that are less likely to change via CLI) ---
 
@@ -27,42 +50,619 @@ local_repo_path = '.' # <<< STRONGLY RECOMMEND CHANGING to absolute path
 github_branch = 'main' # Branch to push to
 repo_subdirectory = 'parameter_backups' # Subdirectory within the repo (optional)
 
+# Resolved once at startup; used by the pre-run checks and by main()
+absolute_repo_path = os.path.abspath(local_repo_path)
+save_directory = os.path.join(absolute_repo_path, repo_subdirectory) if repo_subdirectory else absolute_repo_path
+
+# --- Local Cache Configuration ---
+# Per-machine state that should not live in the backup repository
+cache_directory = os.path.join(os.path.expanduser('~'), '.cache', 'drone_param_backup')
+param_cache_file = os.path.join(cache_directory, 'param_cache.json')
+remote_cache_file = os.path.join(cache_directory, 'remote.json')
+push_log_file = os.path.join(cache_directory, 'push.log') # Output of the last background push
+mavftp_recheck_days = 7 # Re-probe MAVFTP on vehicles that refused it after this long
+remote_check_ttl_seconds = 300 # With --wait-push, trust a remote tip seen this recently without asking origin again
+
 # --- Helper Functions ---
 
-def run_git_command(command, cwd):
+def run_git_command(command, cwd, capture_stdout=False, log=print):
     """Runs a Git command using subprocess and checks for errors."""
-    print(f"Running command: {' '.join(command)} in {cwd}")
+    log(f"Running command: {' '.join(command)} in {cwd}")
     try:
         result = subprocess.run(
             command,
             cwd=cwd,
             check=True,
-            capture_output=True,
+            # Skip the stdout pipe (and its reader) when the output is not needed
+            stdout=subprocess.PIPE if capture_stdout else subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
             text=True,
             encoding='utf-8'
         )
         if result.stdout:
-            print(f"Command successful:\n{result.stdout}")
+            log(f"Command successful:\n{result.stdout}")
         else:
-            print("Command successful (no stdout).")
+            log("Command successful.")
         return True
     except FileNotFoundError:
-        print(f"Error: Git command not found. Is Git installed and in your PATH?")
+        log(f"Error: Git command not found. Is Git installed and in your PATH?")
         return False
     except subprocess.CalledProcessError as e:
-        print(f"Error executing command: {' '.join(command)}")
-        print(f"Return code: {e.returncode}")
+        log(f"Error executing command: {' '.join(command)}")
+        log(f"Return code: {e.returncode}")
         if e.stderr:
-            print(f"Output (stderr):\n{e.stderr}")
+            log(f"Output (stderr):\n{e.stderr}")
         if e.stdout:
-            print(f"Output (stdout):\n{e.stdout}")
-        if "nothing to commit" in e.stderr or "nothing to commit" in e.stdout:
-             print("Note: Git reported 'nothing to commit'.")
+            log(f"Output (stdout):\n{e.stdout}")
+        if "nothing to commit" in (e.stderr or "") or "nothing to commit" in (e.stdout or ""):
+             log("Note: Git reported 'nothing to commit'.")
              return True # Treat as success for commit command
         return False
     except Exception as e:
-        print(f"An unexpected error occurred: {e}")
+        log(f"An unexpected error occurred: {e}")
+        return False
+
+def tune_link_buffers(master):
+    """Enlarges the receive buffer of the MAVLink link so PARAM_VALUE bursts are not dropped."""
+    port = getattr(master, 'port', None)
+    try:
+        if isinstance(port, socket.socket):
+            port.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+            if port.type == socket.SOCK_STREAM:
+                port.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        elif hasattr(port, 'set_buffer_size'):
+            # pyserial only supports this on Windows
+            port.set_buffer_size(rx_size=1 << 16)
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not enlarge the link receive buffer: {e}")
+
+def decode_param_pck(data):
+    """Decodes an ArduPilot @PARAM/param.pck blob into a {name: float} dict, or None if malformed."""
+    if len(data) < 6:
+        return None
+    magic, num_params, total_params = struct.unpack("<HHH", data[0:6])
+    if magic not in (0x671b, 0x671c):
+        print(f"Warning: Bad param.pck magic 0x{magic:x}.")
+        return None
+    with_defaults = magic == 0x671c
+
+    # Type id -> (value length, struct format)
+    data_types = {
+        1: (1, 'b'),
+        2: (2, 'h'),
+        3: (4, 'i'),
+        4: (4, 'f'),
+    }
+
+    parameters = {}
+    last_name = b''
+    pos = 6
+    while True:
+        # Skip padding bytes
+        while pos < len(data) and data[pos] == 0:
+            pos += 1
+        if pos >= len(data):
+            break
+
+        if pos + 2 > len(data):
+            print("Warning: Truncated param.pck entry header.")
+            return None
+        ptype, plen = data[pos], data[pos + 1]
+        has_default = with_defaults and (ptype >> 4) & 1
+        ptype &= 0x0F
+        if ptype not in data_types:
+            print(f"Warning: Bad param.pck type 0x{ptype:x}.")
+            return None
+        type_len, type_format = data_types[ptype]
+
+        name_len = ((plen >> 4) & 0x0F) + 1
+        common_len = plen & 0x0F
+        entry_end = pos + 2 + name_len + type_len * (2 if has_default else 1)
+        if entry_end > len(data):
+            print("Warning: Truncated param.pck entry.")
+            return None
+        pos += 2
+        name = last_name[:common_len] + data[pos:pos + name_len]
+        pos += name_len
+        value, = struct.unpack_from("<" + type_format, data, pos)
+        pos = entry_end
+
+        try:
+            parameters[name.decode('ascii')] = float(value)
+        except UnicodeDecodeError:
+            print(f"Warning: Bad param.pck name {name!r}.")
+            return None
+        last_name = name
+
+    if len(parameters) != num_params or num_params > total_params:
+        print(f"Warning: param.pck contained {len(parameters)} parameters, expected {num_params}/{total_params}.")
+        return None
+    return parameters
+
+def fetch_params_ftp(master, timeout_seconds=20):
+    """Downloads @PARAM/param.pck over MAVFTP; returns (parameters or None, vehicle refused it)."""
+    if mavftp is None:
+        print("pymavlink has no MAVFTP support, skipping bulk parameter download.")
+        return None, False
+
+    received = {}
+    def on_complete(fh):
+        if fh is None:
+            return # Session ended without a file (NAK or retries used up)
+        fh.seek(0)
+        received['data'] = fh.read()
+
+    print("Requesting @PARAM/param.pck over MAVFTP...")
+    try:
+        mav_ftp = mavftp.MAVFTP(master, master.target_system, master.target_component)
+        ret = mav_ftp.cmd_get(['@PARAM/param.pck'], callback=on_complete)
+        if ret.error_code == 0:
+            ret = mav_ftp.process_ftp_reply('OpenFileRO', timeout=timeout_seconds)
+    except Exception as e:
+        print(f"MAVFTP parameter download failed: {e}")
+        return None, False
+
+    if ret.error_code != 0 or 'data' not in received:
+        # Only an explicit NAK means unsupported; timeouts are retried next run.
+        # MAVFTP NAK codes: 7 = UnknownCommand, 10 = FileNotFound,
+        # 2 = FailErrno (ENOENT is how ArduPilot reports a missing file)
+        unsupported = ret.error_code in (7, 10) or (
+            ret.error_code == 2 and getattr(ret, 'system_error', 0) == errno.ENOENT)
+        print(f"MAVFTP parameter download not available (error code {ret.error_code}).")
+        return None, unsupported
+
+    parameters = decode_param_pck(received['data'])
+    if parameters is not None:
+        print(f"Received {len(parameters)} parameters over MAVFTP.")
+    return parameters, False
+
+def vehicle_id(master, timeout_seconds=2):
+    """Returns the board's unique id from AUTOPILOT_VERSION, or None if unknown."""
+    try:
+        master.mav.command_long_send(
+            master.target_system,
+            master.target_component,
+            mavutil.mavlink.MAV_CMD_REQUEST_AUTOPILOT_CAPABILITIES,
+            0, 1, 0, 0, 0, 0, 0, 0
+        )
+        msg = master.recv_match(type='AUTOPILOT_VERSION', blocking=True, timeout=timeout_seconds)
+    except Exception as e:
+        print(f"Warning: Could not request AUTOPILOT_VERSION: {e}")
+        return None
+    if msg is None:
+        return None
+    uid2 = bytes(getattr(msg, 'uid2', None) or b'')
+    if any(uid2):
+        return f"uid2:{uid2.hex()}"
+    if msg.uid:
+        return f"uid:{msg.uid:016x}"
+    return None
+
+def load_cache(cache_file):
+    """Loads a JSON cache file, or returns {} if there is none."""
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_cache(cache_file, cache):
+    """Writes a JSON cache file; failures only print a warning."""
+    try:
+        os.makedirs(cache_directory, exist_ok=True)
+        with open(cache_file, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, indent=2, sort_keys=True)
+    except OSError as e:
+        print(f"Warning: Could not write cache {cache_file}: {e}")
+
+def missing_indices(got, count):
+    """Returns the indices below `count` whose bit is not set in the `got` bitmap."""
+    missing = []
+    for byte_index, byte in enumerate(got):
+        if byte == 0xFF:
+            continue # All 8 indices received
+        base = byte_index << 3
+        for bit in range(8):
+            if not byte & (1 << bit) and base + bit < count:
+                missing.append(base + bit)
+    return missing
+
+def download_params_list(master, parameters, timeout_seconds=45, retry_interval=1.5, retry_batch_size=8, deadline_seconds=300):
+    """Downloads parameters via PARAM_REQUEST_LIST into `parameters`; returns the vehicle's count, or None on timeout."""
+    param_count_expected = None
+    params = None # [(name, value)] indexed by param_index
+    got = None # Bitmap: bit (i & 7) of got[i >> 3] is set once index i is received
+    n_received = 0
+    last_print = 0.0
+    is_tty = sys.stdout.isatty()
+    # Raw chunked reads need a non-blocking file descriptor (not available
+    # for serial ports on Windows); otherwise fall back to recv_msg()
+    use_raw_reads = getattr(master, 'fd', None) is not None
+
+    print("Requesting all parameters...")
+    master.mav.param_request_list_send(
+        master.target_system,
+        master.target_component
+    )
+
+    # All timing uses one monotonic clock read per drain iteration
+    start_time = time.monotonic()
+    last_activity = start_time
+    deadline = start_time + deadline_seconds
+
+    print(f"Waiting for parameters (timeout: {timeout_seconds} seconds)...")
+    try:
+        while True:
+            # Wait for data once, then drain every message already buffered
+            batch = []
+            if master.select(0.5):
+                if use_raw_reads:
+                    # Pull everything buffered in large chunks and parse each
+                    # chunk in one call instead of one recv_msg() per message
+                    while True:
+                        buf = master.recv(4096)
+                        if not buf:
+                            break
+                        for msg in master.mav.parse_buffer(buf) or ():
+                            if msg.get_type() == 'PARAM_VALUE':
+                                batch.append(msg)
+                else:
+                    while True:
+                        msg = master.recv_msg()
+                        if msg is None:
+                            break
+                        if msg.get_type() == 'PARAM_VALUE':
+                            batch.append(msg)
+
+            now = time.monotonic()
+            if now - start_time > timeout_seconds or now > deadline:
+                print("\nError: Timeout waiting for parameters.")
+                if not n_received:
+                     print("No parameters received before timeout.")
+                else:
+                     print(f"Received {n_received} parameters before timeout.")
+                return None
+
+            if not batch:
+                # Stream stalled: re-request the next batch of missing indices
+                if got is None and now - last_activity > retry_interval:
+                    # The request (or every reply so far) was lost
+                    print("\nNo parameters received yet, re-sending the request...")
+                    master.mav.param_request_list_send(
+                        master.target_system,
+                        master.target_component
+                    )
+                    last_activity = now
+                elif got is not None and now - last_activity > retry_interval:
+                    missing = missing_indices(got, param_count_expected)
+                    print(f"\nRequesting {len(missing[:retry_batch_size])} of {len(missing)} missing parameters...")
+                    for idx in missing[:retry_batch_size]:
+                        master.mav.param_request_read_send(
+                            master.target_system,
+                            master.target_component,
+                            b'',
+                            idx
+                        )
+                    last_activity = now
+                continue
+
+            received_before = n_received
+            for msg in batch:
+                if got is None:
+                    param_count_expected = msg.param_count
+                    params = [None] * param_count_expected
+                    got = bytearray((param_count_expected + 7) >> 3)
+
+                i = msg.param_index
+                if i >= param_count_expected or got[i >> 3] & (1 << (i & 7)):
+                    continue # Duplicate, or not part of the parameter list
+
+                # Only reached once per index, so each name is decoded once
+                try:
+                    param_id = msg.param_id
+                    if isinstance(param_id, (bytes, bytearray)):
+                        # Stops at the first NUL in one C-level scan
+                        param_id = param_id.partition(b'\x00')[0].decode('ascii', 'replace')
+                    else:
+                        param_id = param_id.rstrip('\x00')
+                except AttributeError:
+                    print(f"\nWarning: Could not process param_id: {msg.param_id}")
+                    continue
+
+                params[i] = (param_id, msg.param_value)
+                got[i >> 3] |= 1 << (i & 7)
+                n_received += 1
+                last_index = i
+                if n_received == param_count_expected:
+                    break # Anything left in the batch can only be a duplicate
+
+            if n_received == received_before:
+                continue # Only duplicates in this batch
+
+            # Timers and progress are updated once per batch, not per message
+            start_time = now
+            last_activity = now
+
+            if not is_tty:
+                # Logs/pipes: a plain line every 100 parameters, no \r rewrites
+                if n_received // 100 > received_before // 100:
+                    print(f"Received {n_received}/{param_count_expected}")
+            elif now - last_print > 0.05 or n_received == param_count_expected:
+                # Progress line at most every 50 ms; printing every message
+                # costs more than receiving it on slow terminals
+                param_id, param_value = params[last_index]
+                sys.stdout.write(f"\rReceived {n_received}/{param_count_expected}: {param_id} = {param_value} (Index: {last_index})")
+                sys.stdout.flush()
+                last_print = now
+
+            if n_received == param_count_expected:
+                print("\nSuccessfully received all parameters.")
+                return param_count_expected
+    finally:
+        # Also on timeout or exception, so a partial download is not lost
+        if params is not None:
+            # filter() skips the None gaps in C; no per-item generator frame
+            parameters.update(filter(None, params))
+
+def git_blob_sha(content):
+    """Returns the SHA-1 Git would give `content` as a blob object."""
+    # Hash the header and content separately rather than concatenating,
+    # so the file buffer is not copied just to be hashed
+    blob_hash = hashlib.sha1(b"blob %d\0" % len(content))
+    blob_hash.update(content)
+    return blob_hash.hexdigest()
+
+def start_blob_lookup(git_cwd):
+    """Starts a long-lived `git cat-file --batch-check` process, or returns None."""
+    try:
+        return subprocess.Popen(
+            ['git', '-C', git_cwd, 'cat-file', '--batch-check=%(objectname) %(objecttype)'],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding='utf-8'
+        )
+    except OSError as e:
+        print(f"Warning: Could not start git cat-file: {e}")
+        return None
+
+def committed_blob_sha(repo, blob_lookup, relative_param_filepath_git):
+    """Returns the blob SHA of the file at HEAD, or None if it is not committed."""
+    try:
+        if repo is not None:
+            return (repo.head.commit.tree / relative_param_filepath_git).hexsha
+        if blob_lookup is None:
+            return None
+        # "./" makes the path relative to git_cwd rather than the work tree top
+        blob_lookup.stdin.write(f"HEAD:./{relative_param_filepath_git}\n")
+        blob_lookup.stdin.flush()
+        fields = blob_lookup.stdout.readline().split()
+        # "<sha> blob" when found, "<name> missing" otherwise
+        return fields[0] if len(fields) == 2 and fields[1] == 'blob' else None
+    except Exception:
+        # No HEAD yet, file not tracked, or Git unavailable
+        return None
+
+def close_blob_lookup(blob_lookup):
+    """Ends the process from start_blob_lookup(), if there is one."""
+    if blob_lookup is None:
+        return
+    try:
+        blob_lookup.stdin.close()
+    except OSError:
+        pass # cat-file already exited (e.g. not a Git repository)
+    blob_lookup.wait()
+
+def git_output(repo, git_cwd, *git_args):
+    """Runs a read-only git command and returns its stripped stdout; raises on failure."""
+    if repo is not None:
+        return repo.git.execute(['git', *git_args]).strip()
+    return subprocess.run(
+        ['git', *git_args],
+        cwd=git_cwd,
+        check=True,
+        capture_output=True,
+        text=True,
+        encoding='utf-8'
+    ).stdout.strip()
+
+def remember_remote_tip(git_cwd, sha):
+    """Records that origin's github_branch was at `sha` just now."""
+    cache = load_cache(remote_cache_file)
+    cache[f"{git_cwd}:{github_branch}"] = {'sha': sha, 'checked': int(time.time())}
+    save_cache(remote_cache_file, cache)
+
+def pull_needed(repo, git_cwd, trust_cache):
+    """Returns False if HEAD already contains origin's github_branch tip."""
+    try:
+        head = git_output(repo, git_cwd, 'rev-parse', 'HEAD')
+        cached = load_cache(remote_cache_file).get(f"{git_cwd}:{github_branch}")
+        # Trusting a recent tip is only safe with a synchronous push that is
+        # retried after a rebase if origin moved meanwhile (push_commits())
+        if (trust_cache and cached and cached['sha'] == head
+                and time.time() - cached['checked'] < remote_check_ttl_seconds):
+            return False
+
+        remote = git_output(repo, git_cwd, 'ls-remote', 'origin', f'refs/heads/{github_branch}').split()
+        if not remote:
+            return True
+        # Recorded even if a pull follows: head_ahead_of_origin() uses it
+        remember_remote_tip(git_cwd, remote[0])
+        if remote[0] != head:
+            # Already merged if it is an ancestor (e.g. a local commit not yet pushed)
+            git_output(repo, git_cwd, 'merge-base', '--is-ancestor', remote[0], head)
+        return False
+    except Exception:
+        return True
+
+def head_ahead_of_origin(repo, git_cwd):
+    """Returns True if HEAD has commits that origin's github_branch lacks."""
+    try:
+        head = git_output(repo, git_cwd, 'rev-parse', 'HEAD')
+    except Exception:
+        return False # No commits at all
+    cached = load_cache(remote_cache_file).get(f"{git_cwd}:{github_branch}")
+    if not cached:
+        return True
+    if cached['sha'] == head:
+        return False
+    try:
+        git_output(repo, git_cwd, 'merge-base', '--is-ancestor', cached['sha'], head)
+        return True
+    except Exception:
+        return False # Origin has commits HEAD lacks; the next pull brings them in
+
+def pull_rebase(repo, git_cwd, log=print):
+    """Rebases HEAD onto origin's github_branch. Returns True on success."""
+    # Several machines push to the same branch: replay unpushed local commits
+    # on top of theirs. --autostash lets the pull run over a file an earlier
+    # run saved but could not commit; a conflicted rebase is aborted below.
+    if repo is None:
+        if run_git_command(['git', 'pull', '--rebase', '--autostash', 'origin', github_branch], cwd=git_cwd, log=log):
+            return True
+    else:
+        log(f"Pulling origin/{github_branch} (rebase)...")
+        try:
+            repo.remotes.origin.pull(github_branch, rebase=True, autostash=True)
+            return True
+        except Exception as e:
+            log(f"Git pull failed: {e}")
+
+    # No-op (and a non-zero exit) when no rebase is in progress
+    try:
+        subprocess.run(
+            ['git', 'rebase', '--abort'],
+            cwd=git_cwd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+    except OSError:
+        pass # No git executable; run_git_command() already reported it
+    return False
+
+def git_pull(repo, git_cwd, trust_cache, log=print):
+    """Brings HEAD up to date with origin's github_branch. Returns True on success."""
+    if not pull_needed(repo, git_cwd, trust_cache):
+        log(f"origin/{github_branch} has no new commits, skipping pull.")
+        return True
+    return pull_rebase(repo, git_cwd, log)
+
+def start_background_push(git_cwd):
+    """Starts `git push` detached from this process, logging to push_log_file."""
+    try:
+        os.makedirs(cache_directory, exist_ok=True)
+        with open(push_log_file, 'w', encoding='utf-8') as log:
+            log.write(f"git push origin {github_branch} in {git_cwd}\n")
+            log.flush()
+            subprocess.Popen(
+                ['git', 'push', 'origin', github_branch],
+                cwd=git_cwd,
+                stdin=subprocess.DEVNULL,
+                stdout=log,
+                stderr=log,
+                # Fail (and log it) instead of waiting for a password nobody will type
+                env=dict(os.environ, GIT_TERMINAL_PROMPT='0'),
+                start_new_session=True # Keep running after this script exits (POSIX)
+            )
+    except OSError as e:
+        print(f"Error starting git push: {e}")
+        print("Parameter file was saved locally and committed, but not uploaded.")
         return False
+    print(f"Push to origin/{github_branch} started in the background (log: {push_log_file}).")
+    return True
+
+def report_previous_push():
+    """Prints the log of the last background push if that push failed."""
+    try:
+        with open(push_log_file, 'r', encoding='utf-8') as f:
+            log = f.read()
+    except OSError:
+        return # No background push yet
+    if not any(line.startswith(('error:', 'fatal:', ' ! ')) for line in log.splitlines()):
+        return
+    print("Warning: The previous background push failed:")
+    print(log.rstrip())
+    print("Check the remote and credentials; unpushed commits go out with the next push.")
+    try:
+        os.remove(push_log_file) # Report each failure once
+    except OSError:
+        pass
+
+def push_once(repo, git_cwd):
+    """Runs one synchronous `git push`. Returns True on success."""
+    if repo is None:
+        return run_git_command(['git', 'push', 'origin', github_branch], cwd=git_cwd)
+    print(f"Pushing to origin/{github_branch}...")
+    try:
+        push_infos = repo.remotes.origin.push(github_branch)
+    except git.exc.GitCommandError as e:
+        print(f"Git push error: {e}")
+        return False
+    return bool(push_infos) and not any(info.flags & info.ERROR for info in push_infos)
+
+def push_commits(repo, git_cwd, wait_push):
+    """Pushes github_branch to origin. Returns True if the push succeeded or started.
+
+    Unless `wait_push` is set, the push is left running in the background.
+    A synchronous push that fails (e.g. rejected because another machine
+    pushed since the pull) is retried once after rebasing onto origin.
+    `repo` is the GitPython Repo, or None to use the git executable.
+    """
+    if not wait_push:
+        return start_background_push(git_cwd)
+
+    pushed = push_once(repo, git_cwd)
+    if not pushed:
+        print(f"Push failed; rebasing onto origin/{github_branch} and retrying once...")
+        pushed = pull_rebase(repo, git_cwd) and push_once(repo, git_cwd)
+    if not pushed:
+        print("Git push failed. Check connection, permissions, Git config (SSH/HTTPS), and ensure changes were committed.")
+        print("Parameter file was saved locally, possibly committed, but not uploaded.")
+        return False
+
+    # Origin now matches HEAD, so the next run can skip asking it
+    try:
+        remember_remote_tip(git_cwd, git_output(repo, git_cwd, 'rev-parse', 'HEAD'))
+    except Exception:
+        pass
+    return True
+
+def upload_with_gitpython(repo, relative_param_filepath_git, commit_message, wait_push):
+    """Commits and pushes the parameter file through the GitPython Repo session."""
+    # 1. Add and 2. commit the parameter file
+    try:
+        repo.index.add([relative_param_filepath_git])
+        if repo.is_dirty(index=True, working_tree=False, path=relative_param_filepath_git):
+            repo.index.commit(commit_message)
+            print(f"Committed: {commit_message}")
+        else:
+            print("Note: Nothing to commit, parameter file is unchanged.")
+    except Exception as e:
+        print(f"Git add/commit failed: {e}")
+        return False
+
+    # 3. Push the commit
+    return push_commits(repo, repo.working_tree_dir, wait_push)
+
+def upload_with_git_cli(git_cwd, relative_param_filepath_git, commit_message, tracked, wait_push):
+    """Commits and pushes the parameter file by running the git executable."""
+    # 1. Add the parameter file (new files only)
+    if not tracked and not run_git_command(['git', 'add', relative_param_filepath_git], cwd=git_cwd):
+        print("Git add failed. Parameter file changes not staged for commit.")
+        return False
+
+    # 2. Commit the changes
+    # stdout is needed here: git reports "nothing to commit" on stdout
+    if not run_git_command(['git', 'commit', '-m', commit_message, '--', relative_param_filepath_git], cwd=git_cwd, capture_stdout=True):
+        # run_git_command handles "nothing to commit"
+        print("Git commit failed or nothing to commit.")
+        # Decide if we should stop if commit truly failed
+        # return False # Uncomment to stop if commit fails for reasons other than "nothing to commit"
+
+    # 3. Push the commit
+    return push_commits(None, git_cwd, wait_push)
 
 # --- Main Script Logic ---
 
@@ -70,6 +670,36 @@ def run_git_command(command, cwd):
 def main(args):
     """Main execution function, using parsed arguments."""
 
+    # --- 0. Open the Git Repository ---
+    if not os.path.isdir(absolute_repo_path):
+         print(f"Error: Resolved repository path is not a valid directory: {absolute_repo_path}")
+         print(f"Check the 'local_repo_path' setting: {local_repo_path}")
+         return
+    git_cwd = absolute_repo_path
+    report_previous_push()
+
+    repo = None
+    blob_lookup = None
+    if git is not None:
+        try:
+            # local_repo_path may be a subdirectory of the work tree
+            repo = git.Repo(git_cwd, search_parent_directories=True)
+        except Exception as e:
+            # Still download and save; the git executable reports what is wrong
+            print(f"Warning: Could not open Git repository at {git_cwd}: {type(e).__name__}: {e}")
+            print("Falling back to the git executable.")
+    if repo is None:
+        blob_lookup = start_blob_lookup(git_cwd)
+
+    try:
+        backup_parameters(args, git_cwd, repo, blob_lookup)
+    finally:
+        # Also reached on every early return of backup_parameters()
+        close_blob_lookup(blob_lookup)
+
+def backup_parameters(args, git_cwd, repo, blob_lookup):
+    """Downloads the parameters, saves them and commits/pushes the file."""
+
     # Use connection string and filename from args
     connection_string = args.connection_string
     param_filename = args.param_filename
@@ -80,9 +710,11 @@ def main(args):
     parameters = {}
     param_count_expected = None
     vehicle_info = {"system": "N/A", "component": "N/A"}
+    pull_messages = [] # Output of the background pull
 
     try:
-        master = mavutil.mavlink_connection(connection_string, autoreconnect=True)
+        master = mavutil.mavlink_connection(connection_string, autoreconnect=True, dialect='ardupilotmega')
+        tune_link_buffers(master)
 
         print("Waiting for heartbeat...")
         hb = master.wait_heartbeat(timeout=10)
@@ -93,55 +725,44 @@ def main(args):
         vehicle_info["component"] = master.target_component
         print(f"Heartbeat received! (System: {vehicle_info['system']}, Component: {vehicle_info['component']})")
 
-        print("Requesting all parameters...")
-        master.mav.param_request_list_send(
-            master.target_system,
-            master.target_component
-        )
-
-        start_time = time.time()
-        timeout_seconds = 45
-
-        print(f"Waiting for parameters (timeout: {timeout_seconds} seconds)...")
-        while True:
-            current_time = time.time()
-            if current_time - start_time > timeout_seconds:
-                print("\nError: Timeout waiting for parameters.")
-                if not parameters:
-                     print("No parameters received before timeout.")
-                else:
-                     print(f"Received {len(parameters)} parameters before timeout.")
+        # Pull in the background while the parameters download; both are
+        # network-bound and independent until the file is compared and
+        # written. Started only now, so a run that never reaches the
+        # vehicle leaves the working tree alone.
+        pull_executor = ThreadPoolExecutor(max_workers=1)
+        # The cached remote tip is only trusted when the push is synchronous.
+        # Its messages are printed once it is joined.
+        pull_future = pull_executor.submit(git_pull, repo, git_cwd, args.wait_push, pull_messages.append)
+        pull_executor.shutdown(wait=False)
+
+        # Fast path: fetch the whole parameter table in one MAVFTP transfer,
+        # unless this vehicle recently refused it. Only boards with a
+        # unique id are remembered.
+        vehicle_key = vehicle_id(master) if mavftp is not None else None
+        cache = load_cache(param_cache_file)
+        vehicle_cache = cache.get(vehicle_key, {}) if vehicle_key else {}
+        recheck_after = vehicle_cache.get('mavftp_checked', 0) + mavftp_recheck_days * 86400
+        if vehicle_cache.get('mavftp', True) is False and time.time() < recheck_after:
+            print("Skipping MAVFTP: not supported by this vehicle on a recent run.")
+            ftp_parameters = None
+        else:
+            ftp_parameters, ftp_unsupported = fetch_params_ftp(master)
+            if vehicle_key and ftp_unsupported:
+                cache[vehicle_key] = {'mavftp': False, 'mavftp_checked': int(time.time())}
+                save_cache(param_cache_file, cache)
+            elif vehicle_key in cache and ftp_parameters is not None:
+                del cache[vehicle_key] # Supported after all (e.g. firmware update)
+                save_cache(param_cache_file, cache)
+
+        if ftp_parameters is not None:
+            parameters.update(ftp_parameters)
+            param_count_expected = len(ftp_parameters)
+        else:
+            print("Falling back to PARAM_REQUEST_LIST download.")
+            param_count_expected = download_params_list(master, parameters)
+            if param_count_expected is None:
                 return
 
-            msg = master.recv_match(type='PARAM_VALUE', blocking=True, timeout=2)
-
-            if msg:
-                try:
-                    param_id = msg.param_id.rstrip('\x00')
-                except AttributeError:
-                    print(f"\nWarning: Could not process param_id: {msg.param_id}")
-                    param_id = None
-
-                if param_id:
-                    if param_count_expected is None:
-                        param_count_expected = msg.param_count
-
-                    parameters[param_id] = msg.param_value
-                    param_index_received = msg.param_index
-
-                    print(f"\rReceived {len(parameters)}/{param_count_expected}: {param_id} = {msg.param_value} (Index: {param_index_received})", end="")
-                    start_time = time.time()
-
-                    if param_count_expected is not None and param_index_received == param_count_expected - 1:
-                        parameters[param_id] = msg.param_value
-                        print(f"\rReceived {len(parameters)}/{param_count_expected}: {param_id} = {msg.param_value} (Index: {param_index_received})", end="")
-                        print("\nSuccessfully received all parameters (based on index).")
-                        break
-                    elif param_count_expected is not None and len(parameters) >= param_count_expected:
-                         print("\nWarning: Parameter download completion based on count, not index.")
-                         print("\nSuccessfully received all parameters (based on count).")
-                         break
-
     except Exception as e:
         import traceback
         print(f"\nError during MAVLink communication:")
@@ -159,27 +780,17 @@ def main(args):
         print("No parameters were downloaded. Exiting.")
         return
 
-    print(f"\nTotal parameters downloaded: {len(parameters)}")
+    # Taken once, when the parameters were read; used in the commit message
+    downloaded_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    print(f"\nTotal parameters downloaded: {len(parameters)} (at {downloaded_at})")
     if param_count_expected is not None and len(parameters) != param_count_expected:
         print(f"Warning: Expected {param_count_expected} parameters, but downloaded {len(parameters)}.")
 
     # --- 2. Save Parameters to Specified .param File ---
-    try:
-        absolute_repo_path = os.path.abspath(local_repo_path)
-        if not os.path.isdir(absolute_repo_path):
-             print(f"Error: Resolved repository path is not a valid directory: {absolute_repo_path}")
-             print(f"Check the 'local_repo_path' setting: {local_repo_path}")
-             return
-    except Exception as e:
-        print(f"Error resolving local_repo_path '{local_repo_path}': {e}")
-        return
-
-    save_directory = absolute_repo_path
-    if repo_subdirectory:
-        save_directory = os.path.join(absolute_repo_path, repo_subdirectory)
+    if not os.path.isdir(save_directory):
         try:
-            os.makedirs(save_directory, exist_ok=True)
-            print(f"Ensured directory exists: {save_directory}")
+            os.makedirs(save_directory)
+            print(f"Created directory: {save_directory}")
         except OSError as e:
             print(f"Error creating directory {save_directory}: {e}")
             return
@@ -187,64 +798,104 @@ def main(args):
     # Use the filename provided via command line argument
     full_param_filepath = os.path.join(save_directory, param_filename)
 
-    print(f"Saving parameters to: {full_param_filepath} (overwriting if exists)")
+    # Git paths always use '/', whatever the local OS separator is. GitPython
+    # wants them relative to the top of the work tree, the git executable
+    # relative to git_cwd.
+    if repo is not None:
+        relative_param_filepath_git = PurePath(os.path.relpath(
+            os.path.realpath(full_param_filepath), os.path.realpath(repo.working_tree_dir))).as_posix()
+    else:
+        relative_param_filepath_git = PurePosixPath(repo_subdirectory or '', param_filename).as_posix()
+
+    # Build the file in memory first. The content is deterministic (no
+    # timestamp, that goes in the commit message) so unchanged parameters
+    # produce the exact blob that is already committed.
+    lines = [
+        "# ArduPilot Parameter File\n",
+        f"# Source Connection: {connection_string}\n", # Add connection info
+        f"# Vehicle: System={vehicle_info['system']}, Component={vehicle_info['component']}\n",
+        f"# Parameters: {len(parameters)}\n",
+        "#\n",
+    ]
+    # PARAM_VALUE (and the decoded param.pck) values are always floats.
+    # Only the names are sorted (plain str compares, no (name, value) tuples);
+    # %-formatting takes the C fast path for floats.
+    lines.extend("%s,%.8f\n" % (name, parameters[name]) for name in sorted(parameters))
+    content = "".join(lines).encode('utf-8')
+
+    # Compare against HEAD only once the pull has brought it up to date
+    pulled = pull_future.result()
+    for message in pull_messages:
+        print(message)
+    committed_sha = None
+    if not pulled:
+        # Keep a local backup anyway; the Git steps wait for the next run
+        print("Git pull failed. The parameter file will be saved locally, but not committed or pushed.")
+    else:
+        committed_sha = committed_blob_sha(repo, blob_lookup, relative_param_filepath_git)
+        if git_blob_sha(content) == committed_sha:
+            print(f"No parameter changes since the last committed {relative_param_filepath_git}.")
+            if not head_ahead_of_origin(repo, git_cwd):
+                print("Skipping save, commit and push.")
+                print("Script finished.")
+                return
+            # e.g. the push of an earlier run failed
+            print(f"Skipping save and commit; pushing local commits that origin/{github_branch} does not have yet.")
+            if push_commits(repo, git_cwd, args.wait_push):
+                print("Script finished.")
+            return
+
+    # The working copy can already hold this content while HEAD does not,
+    # e.g. after an earlier run whose commit or push failed
     try:
-        with open(full_param_filepath, 'w', encoding='utf-8') as f:
-            f.write(f"# ArduPilot Parameter File\n")
-            f.write(f"# Source Connection: {connection_string}\n") # Add connection info
-            f.write(f"# Last Updated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"# Vehicle: System={vehicle_info['system']}, Component={vehicle_info['component']}\n")
-            f.write(f"# Parameters: {len(parameters)}\n")
-            f.write("#\n")
-
-            for name, value in sorted(parameters.items()):
-                if isinstance(value, float):
-                    f.write(f"{name},{value:.8f}\n")
-                else:
-                    f.write(f"{name},{value}\n")
+        with open(full_param_filepath, 'rb') as f:
+            on_disk = f.read()
+    except OSError:
+        on_disk = None
+
+    if on_disk == content:
+        print(f"{full_param_filepath} already holds these parameters (not yet committed).")
+    else:
+        print(f"Saving parameters to: {full_param_filepath} (overwriting if exists)")
+        # Write a temporary file and rename it over the old one, so a crash
+        # mid-write never leaves a truncated file for git to pick up
+        tmp_param_filepath = full_param_filepath + '.tmp'
+        try:
+            with open(tmp_param_filepath, 'wb', buffering=1 << 16) as f:
+                f.write(content)
+            os.replace(tmp_param_filepath, full_param_filepath)
+            print("Parameters saved successfully.")
+        except IOError as e:
+            print(f"Error saving parameters to file {full_param_filepath}: {e}")
+            if os.path.exists(tmp_param_filepath):
+                os.remove(tmp_param_filepath)
+            return
 
-        print("Parameters saved successfully.")
-    except IOError as e:
-        print(f"Error saving parameters to file {full_param_filepath}: {e}")
+    if not pulled:
+        print(f"Parameters saved locally to {full_param_filepath}; skipped commit and push.")
+        print("Resolve the Git problem above and run the script again to upload them.")
         return
 
     # --- 3. Upload to GitHub using Git commands ---
     print("\nAttempting to commit and push parameter file changes to GitHub...")
 
-    relative_param_filepath = os.path.join(repo_subdirectory, param_filename) if repo_subdirectory else param_filename
-    relative_param_filepath_git = relative_param_filepath.replace(os.path.sep, '/')
-    git_cwd = absolute_repo_path
+    # Include filename in commit message for clarity when using CLI args
+    commit_message = f"Update parameters for {param_filename} ({downloaded_at})"
 
     print("--- Git Operations ---")
 
-    # 1. Pull latest changes
-    if not run_git_command(['git', 'pull', 'origin', github_branch], cwd=git_cwd):
-        print("Git pull failed. Please resolve any conflicts manually and try again.")
-        print("Parameter file was saved locally but changes were not committed or pushed.")
-        return
-
-    # 2. Add the parameter file
-    if not run_git_command(['git', 'add', relative_param_filepath_git], cwd=git_cwd):
-        print("Git add failed. Parameter file changes not staged for commit.")
-        return
-
-    # 3. Commit the changes
-    # Include filename in commit message for clarity when using CLI args
-    commit_message = f"Update parameters for {param_filename} ({datetime.now().strftime('%Y-%m-%d')})"
-    if not run_git_command(['git', 'commit', '-m', commit_message], cwd=git_cwd):
-        # run_git_command handles "nothing to commit"
-        print("Git commit failed or nothing to commit.")
-        # Decide if we should stop if commit truly failed
-        # return # Uncomment to stop if commit fails for reasons other than "nothing to commit"
-
-    # 4. Push the commit
-    if not run_git_command(['git', 'push', 'origin', github_branch], cwd=git_cwd):
-        print("Git push failed. Check connection, permissions, Git config (SSH/HTTPS), and ensure changes were committed.")
-        print("Parameter file was saved locally, possibly committed, but not uploaded.")
+    if repo is not None:
+        uploaded = upload_with_gitpython(repo, relative_param_filepath_git, commit_message, args.wait_push)
+    else:
+        uploaded = upload_with_git_cli(git_cwd, relative_param_filepath_git, commit_message, committed_sha is not None, args.wait_push)
+    if not uploaded:
         return
 
     print("--- Git Operations Finished ---")
-    print(f"Successfully pushed changes for {param_filename} to GitHub repository branch '{github_branch}'.")
+    if args.wait_push:
+        print(f"Successfully pushed changes for {param_filename} to GitHub repository branch '{github_branch}'.")
+    else:
+        print(f"Committed changes for {param_filename}; the push to branch '{github_branch}' continues in the background.")
     print("Script finished.")
 
 
@@ -267,6 +918,12 @@ if __name__ == "__main__":
         dest="param_filename", # Store in args.param_filename
         help="Output parameter filename (will be overwritten). Default: ardupilot_current.param"
     )
+    parser.add_argument(
+        "--wait-push",
+        action="store_true", # Default: push in the background and exit
+        dest="wait_push", # Store in args.wait_push
+        help="Wait for git push to finish and report its result (e.g., for CI). By default the push runs in the background."
+    )
     # Add other arguments here if needed (e.g., --repo-path, --branch)
 
     args = parser.parse_args() # Parse arguments from command line
@@ -285,17 +942,12 @@ if __name__ == "__main__":
              exit() # Use exit() instead of return outside a function
 
     # Check if the resolved repo path exists before calling main
-    try:
-        absolute_repo_path_check = os.path.abspath(local_repo_path)
-        if not os.path.isdir(absolute_repo_path_check):
-             print(f"ERROR: The specified 'local_repo_path' does not exist or is not a directory:")
-             print(f"  Configured: {local_repo_path}")
-             print(f"  Resolved to: {absolute_repo_path_check}")
-             print("Please correct the path in the script.")
-             exit()
-    except Exception as e:
-        print(f"Error resolving local_repo_path '{local_repo_path}': {e}")
-        exit()
+    if not os.path.isdir(absolute_repo_path):
+         print(f"ERROR: The specified 'local_repo_path' does not exist or is not a directory:")
+         print(f"  Configured: {local_repo_path}")
+         print(f"  Resolved to: {absolute_repo_path}")
+         print("Please correct the path in the script.")
+         exit()
 
     # --- Execute Main Logic ---
     main(args) # Pass the parsed arguments to the main function
@@ -1 +1 @@
-python3 param_manager.py -c tcp:127.0.0.1:5762 -f simulation_ardupilot.param
\ No newline at end of file
+python3 param_manager.py -c udp:127.0.0.1:14551 -f simulation_ardupilot.param
\ No newline at end of file